@@ -1,3 +1,4 @@
 NSE_COMPANY_NAME_AND_SYMBOLS_FILE_NAME = 'nse_company_name_and_symbols.csv'
+NSE_COMPANY_NAME_AND_SYMBOLS_PARQUET_FILE_NAME = 'nse_company_name_and_symbols.parquet'
 NAME_OF_COMP_COLUMN = 'NAME OF COMPANY'
 SYMBOL_COLUMN = 'SYMBOL'
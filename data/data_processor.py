@@ -6,7 +6,7 @@ from typing import List, Type
 import joblib
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import StandardScaler
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
 
 from data.raw_data import RawDataSource
 
@@ -20,13 +20,13 @@ class DataProcessor(ABC):
     def get_preprocessed_dfs(self):
         """Returns train, val and test dataframes"""
 
-    @ abstractmethod
-    def get_preprocessed_prediction_df(self, pred_date: dt.date):
-        """Returns a preprocessed dataframe to be used for prediction"""
+    @abstractmethod
+    def get_preprocessed_prediction_dfs(self, pred_dates: List[dt.date]):
+        """Returns a preprocessed dataframe for each prediction date"""
 
     @abstractmethod
     def invTransform(self, y):
-        """Returns inverse transformed predictions"""
+        """Returns 1-D array of inverse transformed predictions"""
 
 
 class PandasDataProcessor(DataProcessor):
@@ -56,7 +56,7 @@ class PandasDataProcessor(DataProcessor):
 
         return (train_x, train_y), (val_x, val_y),  (test_x, test_y)
 
-    def get_preprocessed_df(self, df: pd.DataFrame, scaler=None, return_y: bool = True):
+    def get_preprocessed_df(self, df: pd.DataFrame, scaler=None, return_y: bool = True, keep_index: bool = False):
         df = df.astype(np.float64)
         df.dropna(inplace=True)
 
@@ -65,11 +65,12 @@ class PandasDataProcessor(DataProcessor):
         df = df.pct_change()
         df.replace([np.inf, -np.inf], np.nan, inplace=True)
         df.dropna(inplace=True)
-        df.reset_index(inplace=True, drop=True)
+        if not keep_index:
+            df.reset_index(inplace=True, drop=True)
 
         if scaler is None:
             scaler = StandardScaler().fit(df)
-        df = pd.DataFrame(scaler.transform(df), columns=self.raw_data_source.FEATURE_KEYS)
+        df = pd.DataFrame(scaler.transform(df), columns=self.raw_data_source.FEATURE_KEYS, index=df.index)
 
         if return_y:
             df['target'] = df[self.raw_data_source.CLOSE_COLUMN].shift(-self.future_predict_period)
@@ -78,23 +79,27 @@ class PandasDataProcessor(DataProcessor):
 
         return df, scaler
 
-    def get_preprocessed_prediction_df(self, pred_date: dt.date) -> pd.DataFrame:
-        # after preprocessing data, some rows will get dropped, so that's why x=x.tail(seq_len) needs to be done after preprocessing
+    def get_preprocessed_prediction_dfs(self, pred_dates: List[dt.date]) -> List[pd.DataFrame]:
         df = self.raw_data_source.get_raw_df()
-        # in loc the end index is included so subtracting 1
-        end_date = pred_date - dt.timedelta(days=1)
-        df = df.loc[:end_date]
-
         df = df[self.raw_data_source.FEATURE_KEYS]
         scaler = self.get_scaler()
-        x, _ = self.get_preprocessed_df(df, scaler=scaler, return_y=False)
 
-        len_x = len(x)
-        if len_x < self.seq_len:
-            raise NotEnoughSequencesError(self.seq_len, len_x)
+        # a preprocessed row only depends on the rows before it, so preprocessing the whole df once gives the same rows
+        # as preprocessing it till each pred_date. Some rows get dropped in preprocessing, that's why the last seq_len
+        # rows are taken after preprocessing
+        x, _ = self.get_preprocessed_df(df, scaler=scaler, return_y=False, keep_index=True)
+        return [self._get_prediction_sequence(x, pred_date) for pred_date in pred_dates]
 
-        x = x.tail(self.seq_len)
-        return x
+    def _get_prediction_sequence(self, x: pd.DataFrame, pred_date: dt.date) -> pd.DataFrame:
+        # in loc the end index is included so subtracting 1
+        end_date = pred_date - dt.timedelta(days=1)
+        len_x = len(x.loc[:end_date])
+        # same sampling as the training sequences: seq_len rows, step rows apart, ending right before pred_date
+        required_len = (self.seq_len - 1) * self.step + 1
+        if len_x < required_len:
+            raise NotEnoughSequencesError(required_len, len_x)
+
+        return x.iloc[len_x - required_len: len_x: self.step]
 
     def train_val_test_split(self, df: pd.DataFrame) -> List[pd.DataFrame]:
         test_split = int((1-self.TEST_SPLIT_FRACTION) * len(df))
@@ -133,10 +138,24 @@ class PandasDataProcessor(DataProcessor):
         closeCol = self.raw_data_source.CLOSE_COLUMN
         scaler = self.get_scaler()
 
+        # only the close column is needed, so invert its scaling directly instead of the whole feature matrix
+        y = np.ravel(y)
+        closeColIdx = colNames.index(closeCol)
+        if isinstance(scaler, StandardScaler):
+            if scaler.scale_ is not None:
+                y = y * scaler.scale_[closeColIdx]
+            if scaler.mean_ is not None:
+                y = y + scaler.mean_[closeColIdx]
+            return y
+
+        if isinstance(scaler, MinMaxScaler):
+            y = (y - scaler.min_[closeColIdx]) / scaler.scale_[closeColIdx]
+            return y
+
         dummy = pd.DataFrame(np.zeros((len(y), len(colNames))), columns=colNames)
         dummy[closeCol] = y
         dummy = pd.DataFrame(scaler.inverse_transform(dummy), columns=colNames)
-        return dummy[closeCol].values[0]
+        return dummy[closeCol].values
 
 
 class NotEnoughSequencesError(Exception):
@@ -1,12 +1,12 @@
 import datetime as dt
-from collections import deque
-from typing import Type
+from typing import List, Type
 
 import numpy as np
 import pandas as pd
 from data.data_processor import DataProcessor
 from data.preprocessed_data import PreprocessedData
 from data.raw_data import RawDataSource
+import tensorflow as tf
 from tensorflow import keras
 
 
@@ -40,85 +40,14 @@ class KerasPreprocessedData(PreprocessedData):
             sampling_rate=self.step,
             batch_size=self.batch_size,
         )
+        # windows are small enough to keep in memory, so build them only once instead of every epoch
+        dataset = dataset.cache().prefetch(tf.data.AUTOTUNE)
         return dataset
 
-        #     print(i, ((self.seq_len-1) + self.seq_len*3))
-        #     if (i % ((self.seq_len-1) + self.seq_len*3) == 0):
-        #         print(i)
-        #         print(x[i: i+10])
-        #     print(y[i])
-        #     print()
-
-        # print()
-        # print('Y')
-        # print(y[self.seq_len-1: self.seq_len*5])
-        # print()
-
-        # sequential_data = []
-        # prev_days = deque(maxlen=self.seq_len)
-        # # print(x[self.seq_len-1:])
-        # print()
-        # print('T: ')
-        # print(t)
-        # print()
-
-        # j = 0
-        # for i in x.values:
-        #     prev_days.append([n for n in i])
-        #     if len(prev_days) == self.seq_len and j < len(t):
-        #         sequential_data.append([np.array(prev_days), t[j]])
-        #         j += 1
-
-        # X = []
-        # y = []
-
-        # for seq, target in sequential_data:  # going over our new sequential data
-        #     X.append(seq)  # X is the sequences
-        #     y.append(target)  # y is the targets/labels (buys vs sell/notbuy)
-
-        # print()
-        # print('SENTDEX')
-        # print()
-        # for i in range(3):
-        #     print(X[i][0], y[i])
-
-        # print()
-        # print()
-        # print()
-
-        # print()
-        # print('KERAS')
-        # print()
-        # # return np.array(X), y
-        # # random.shuffle(sequential_data)
-
-        # print('##############################################')
-        # print(len(x), len(y), len(y)//self.seq_len, len(x)/self.seq_len//batch_size)
-        # i = 0
-        # for x, y in dataset:
-        #     i += 1
-        # print(i)
-        # print('y', len(y))
-        # # print('y', y)
-        # # print('x', x)
-        # #     for i in range(1):
-        # #         print('x', x[i][0])
-        # print('##############################################')
-
-    def get_preprocessed_prediction_dataset(self, pred_date: dt.date):
-
-        x = self.data_processor.get_preprocessed_prediction_df(pred_date)
-        dataset = keras.preprocessing.timeseries_dataset_from_array(
-            x,
-            targets=None,
-            sequence_length=self.seq_len,
-            sampling_rate=self.step,
-            batch_size=self.batch_size,
-        )
-        return dataset
-
-        # x = np.expand_dims(x, 0)
-        # return x, scaler
+    def get_preprocessed_prediction_batch(self, pred_dates: List[dt.date]) -> np.ndarray:
+        """Returns array of shape (len(pred_dates), seq_len, n_features)"""
+        xs = self.data_processor.get_preprocessed_prediction_dfs(pred_dates)
+        return np.stack([x.values for x in xs])
 
     def invTransform(self, y):
         return self.data_processor.invTransform(y)
@@ -1,6 +1,6 @@
 import datetime as dt
 from abc import ABC, abstractmethod
-from typing import Type
+from typing import List, Type
 
 from data.data_processor import DataProcessor
 from data.raw_data import RawDataSource
@@ -17,9 +17,9 @@ class PreprocessedData(ABC):
         """Returns train, val and test dataset"""
 
     @abstractmethod
-    def get_preprocessed_prediction_dataset(self, pred_date: dt.date):
-        """Returns dataset to be used for prediction"""
+    def get_preprocessed_prediction_batch(self, pred_dates: List[dt.date]):
+        """Returns a batch with one input sequence per prediction date"""
 
     @abstractmethod
     def invTransform(self, y):
-        """Returns inverse transformed predictions"""
+        """Returns 1-D array of inverse transformed predictions"""
@@ -1,21 +1,50 @@
+import functools
 import os
 
 import pandas as pd
 
 from data.constants import (NAME_OF_COMP_COLUMN,
                             NSE_COMPANY_NAME_AND_SYMBOLS_FILE_NAME,
+                            NSE_COMPANY_NAME_AND_SYMBOLS_PARQUET_FILE_NAME,
                             SYMBOL_COLUMN)
 
+_BASE_DIR = os.path.dirname(os.path.realpath(__file__))
 
+
+# the returned df is shared between callers, so it must not be modified in place
+@functools.lru_cache(maxsize=1)
 def get_all_nse_company_names_and_ticker() -> pd.DataFrame:
-    base_path = os.path.dirname(os.path.realpath(__file__))
-    file_path = os.path.join(base_path, NSE_COMPANY_NAME_AND_SYMBOLS_FILE_NAME)
+    file_path = os.path.join(_BASE_DIR, NSE_COMPANY_NAME_AND_SYMBOLS_FILE_NAME)
+    parquet_file_path = os.path.join(_BASE_DIR, NSE_COMPANY_NAME_AND_SYMBOLS_PARQUET_FILE_NAME)
+
+    # the csv is the source of truth, deleting or replacing it must not leave the parquet copy in use
+    if os.path.exists(file_path) and os.path.exists(parquet_file_path) \
+            and os.path.getmtime(parquet_file_path) >= os.path.getmtime(file_path):
+        try:
+            return pd.read_parquet(parquet_file_path)
+        except Exception:
+            # parquet engine is not installed (anymore) or the file is corrupt, the csv gets read and the
+            # parquet copy rewritten below
+            pass
 
     if os.path.exists(file_path):
-        return pd.read_csv(file_path)
+        df = pd.read_csv(file_path)
+    else:
+        url = 'https://archives.nseindia.com/content/equities/EQUITY_L.csv'
+        df = pd.read_csv(url)
+        df = df[[NAME_OF_COMP_COLUMN, SYMBOL_COLUMN]]
+        df.to_csv(file_path, index=False)
 
-    url = 'https://archives.nseindia.com/content/equities/EQUITY_L.csv'
-    df = pd.read_csv(url)
-    df = df[[NAME_OF_COMP_COLUMN, SYMBOL_COLUMN]]
-    df.to_csv(file_path, index=False)
+    save_as_parquet(df, parquet_file_path)
     return df
+
+
+def save_as_parquet(df: pd.DataFrame, file_path: str) -> None:
+    # parquet is much faster to read than csv, but needs pyarrow or fastparquet which are optional
+    # written to a tmp file first, so that a killed process can't leave a truncated parquet file behind
+    tmp_file_path = file_path + '.tmp'
+    try:
+        df.to_parquet(tmp_file_path, index=False)
+    except ImportError:
+        return
+    os.replace(tmp_file_path, file_path)
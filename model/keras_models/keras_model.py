@@ -1,22 +1,58 @@
 import os
+import shutil
+import tempfile
 from abc import ABC, abstractmethod
-from typing import Type
+from typing import List, Type
 
 from data.data_processor import DataProcessor
 from data.preprocessed_data import PreprocessedData
 from data.raw_data import RawDataSource
 from model.model import Model, ModelNotFoundError
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import mixed_precision
 from tensorflow.keras.layers import LSTM, BatchNormalization, Dense, Dropout
 from tensorflow.keras.models import Sequential
-from tensorflow.python.framework import errors_impl
+from tensorflow.keras.optimizers import Adam
 from tensorflow.python.keras.callbacks import ModelCheckpoint
 
 from .constants import (BATCH_SIZE, FUTURE_PERIOD_PREDICT,
                         SAVED_MODELS_BASE_PATH, SEQ_LEN, STEP)
 from .utils import get_date_from_string, get_prediction_date
 
+_BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+_gpu_availability_logged = False
+
+
+def log_gpu_availability() -> None:
+    """
+    Prints once per process whether a GPU is visible to tensorflow.
+
+    Without a GPU keras can't use the fused cuDNN LSTM kernel. With a GPU, tensorflow warns that the layer
+    "will not use cuDNN kernels" if an LSTM doesn't meet the cuDNN criteria.
+    """
+    global _gpu_availability_logged
+    if _gpu_availability_logged:
+        return
+    _gpu_availability_logged = True
+
+    gpus = tf.config.list_physical_devices('GPU')
+    if gpus:
+        print(f"Found GPU(s): {[gpu.name for gpu in gpus]}. Watch for the 'will not use cuDNN kernels' warning to see if an LSTM layer can't use the fused cuDNN kernel.")
+    else:
+        print('No GPU found. LSTM layers will run on CPU without the fused cuDNN kernel.')
+
+
+# fp16 only pays off on GPUs (tensor cores), on CPU it is slower than fp32
+if tf.config.list_physical_devices('GPU'):
+    mixed_precision.set_global_policy('mixed_float16')
+
 
 class KerasModel(Model, ABC):
+    # bump when _create_model changes, so that checkpoints of an older architecture are not loaded
+    MODEL_VERSION = 1
+
     def __init__(self, ticker: str, preprocessed_data: Type[PreprocessedData],
                  data_processor: Type[DataProcessor], raw_data_source: Type[RawDataSource],
                  name: str, seq_len: int = SEQ_LEN, batch_size: int = BATCH_SIZE,
@@ -32,17 +68,29 @@ class KerasModel(Model, ABC):
         self.batch_size = batch_size
         self.step = step
         self.input_shape = (seq_len, len(self.preprocessed_data.data_processor.raw_data_source.FEATURE_KEYS))
+        self._cached_model = None
+        # mtime of the checkpoint whose weights the cached model has, None if they need to be (re)loaded
+        self._cached_weights_mtime = None
+        self._predict_fn = None
+        self._predict_fn_model = None
+        # the loaded TensorRT saved model has to be kept alive for its signature to be callable
+        self._trt_model = None
+        self._trt_predict_fn = None
+        # mtime of the TensorRT model the cached predict fn was loaded from
+        self._trt_model_mtime = None
 
     def train(self, epochs: int = 1):
         dataset_train, dataset_val, dataset_test = self.preprocessed_data.get_preprocessed_datasets()
 
-        for batch in dataset_train.take(1):
-            inputs, targets = batch
-        print("Input shape:", inputs.numpy().shape)
-        print("Target shape:", targets.numpy().shape)
+        # element_spec gives the shapes without computing a batch, unknown dims (e.g. batch size) are None
+        inputs_spec, targets_spec = dataset_train.element_spec
+        print("Input shape:", inputs_spec.shape)
+        print("Target shape:", targets_spec.shape)
 
-        input_shape = (inputs.shape[1], inputs.shape[2])
-        assert input_shape == self.input_shape
+        # the window dim is reported as None by timeseries_dataset_from_array, so it's only checked when known
+        _, window_len, n_features = inputs_spec.shape
+        assert n_features == self.input_shape[1]
+        assert window_len is None or window_len == self.seq_len
 
         model = self.__get_model()
 
@@ -57,9 +105,15 @@ class KerasModel(Model, ABC):
             callbacks=[checkpoint]
         )
 
+        # only the best weights are saved, so they are loaded into the same model on next use
+        self._cached_model = model
+        self._cached_weights_mtime = None
+
         print('History: ', history.history)
         print('Test Loss: ', model.evaluate(dataset_test))
 
+        self.__export_trt_model()
+
     def __get_model(self):
         try:
             model = self.__load_saved_model()
@@ -69,45 +123,162 @@ class KerasModel(Model, ABC):
 
     def __load_saved_model(self):
         # the weights of the loaded model can be different from the weights of the model in train cuz only the best weights are saved.
-        checkpoint_path = self._get_checkpoint_path()
-        model = self._create_model()
-        # latest = tf.train.latest_checkpoint(os.path.dirname(checkpoint_path))
-        try:
-            model.load_weights(checkpoint_path)
-        except errors_impl.NotFoundError:
+        weights_mtime = self.__get_checkpoint_mtime()
+        # checking for the checkpoint file is cheaper than letting load_weights fail, and avoids building a model for nothing
+        if weights_mtime is None:
             raise ModelNotFoundError(self.ticker, self.seq_len, self.step)
+        if self._cached_model is not None and weights_mtime == self._cached_weights_mtime:
+            return self._cached_model
+
+        model = self._cached_model if self._cached_model is not None else self._create_model()
+        # values which are not restored right away (e.g. optimizer state, restored once training starts) shouldn't warn
+        model.load_weights(self._get_checkpoint_path()).expect_partial()
+
+        self._cached_model = model
+        self._cached_weights_mtime = weights_mtime
         return model
 
+    def __get_checkpoint_mtime(self):
+        index_path = self._get_checkpoint_path() + '.index'
+        if not os.path.exists(index_path):
+            return None
+        return os.path.getmtime(index_path)
+
+    def __export_trt_model(self):
+        """Converts the best saved weights into a TensorRT FP16 saved model which is then used by predict"""
+        # a TensorRT model from an earlier training would have stale weights
+        trt_model_path = self._get_trt_model_path()
+        if os.path.exists(trt_model_path):
+            shutil.rmtree(trt_model_path)
+        self._trt_model = None
+        self._trt_predict_fn = None
+        self._trt_model_mtime = None
+
+        if not tf.config.list_physical_devices('GPU'):
+            print('No GPU found. Skipping TensorRT conversion, predictions will use the keras model.')
+            return
+
+        if self.__get_checkpoint_mtime() is None:
+            print('No checkpoint was saved. Skipping TensorRT conversion.')
+            return
+
+        # the full saved model is only needed as input for the conversion
+        saved_model_path = tempfile.mkdtemp()
+        try:
+            self.__load_saved_model().save(saved_model_path)
+
+            conversion_params = tf.experimental.tensorrt.ConversionParams(precision_mode='FP16',
+                                                                          max_batch_size=self.batch_size)
+            converter = tf.experimental.tensorrt.Converter(input_saved_model_dir=saved_model_path,
+                                                           conversion_params=conversion_params)
+            converter.convert()
+
+            def input_fn():
+                yield (np.zeros((self.batch_size, *self.input_shape), dtype=np.float32),)
+
+            converter.build(input_fn=input_fn)
+            converter.save(trt_model_path)
+        except Exception as e:
+            # e.g. tensorflow was not built with TensorRT or TensorRT libs are not installed.
+            # Training itself succeeded, so don't fail train() because of the optional conversion
+            print(f'TensorRT conversion failed, predictions will use the keras model. Error: {e}')
+            shutil.rmtree(trt_model_path, ignore_errors=True)
+        finally:
+            shutil.rmtree(saved_model_path, ignore_errors=True)
+
+    def __get_trt_predict_fn(self):
+        """Returns a function which predicts using the TensorRT model or None if there is no up to date such model"""
+        trt_model_mtime = self.__get_trt_model_mtime()
+        weights_mtime = self.__get_checkpoint_mtime()
+        # a TensorRT model older than the checkpoint is from an earlier training (e.g. retrained by another process)
+        if trt_model_mtime is None or weights_mtime is None or trt_model_mtime < weights_mtime:
+            self._trt_model = None
+            self._trt_predict_fn = None
+            self._trt_model_mtime = None
+            return None
+
+        if self._trt_predict_fn is not None and trt_model_mtime == self._trt_model_mtime:
+            return self._trt_predict_fn
+
+        self._trt_model = tf.saved_model.load(self._get_trt_model_path())
+        signature = self._trt_model.signatures['serving_default']
+        input_name = list(signature.structured_input_signature[1])[0]
+        output_name = list(signature.structured_outputs)[0]
+
+        def trt_predict_fn(x):
+            return signature(**{input_name: tf.cast(x, tf.float32)})[output_name].numpy()
+
+        self._trt_predict_fn = trt_predict_fn
+        self._trt_model_mtime = trt_model_mtime
+        return trt_predict_fn
+
+    def __get_trt_model_mtime(self):
+        saved_model_pb_path = os.path.join(self._get_trt_model_path(), 'saved_model.pb')
+        if not os.path.exists(saved_model_pb_path):
+            return None
+        return os.path.getmtime(saved_model_pb_path)
+
     def predict(self, date: str = None):
-        y, pred_date = self._predict(date)
-        if date is not None:
-            date = get_date_from_string(date)
-            if pred_date != date:
-                weekday_name = date.strftime('%A')
-                print(f'Date given ({date}) is a {weekday_name}. So, actual prediction is for: {pred_date} (Monday)')
-        return y, pred_date
-
-    def _predict(self, date: str = None):
+        ys, pred_dates = self.predict_many([date])
+        return ys[0], pred_dates[0]
+
+    def predict_many(self, dates: List[str]):
+        if not dates:
+            raise ValueError('dates must contain at least one date (or None for the latest prediction)')
+        ys, pred_dates = self._predict_many(dates)
+        for date, pred_date in zip(dates, pred_dates):
+            if date is not None:
+                date = get_date_from_string(date)
+                if pred_date != date:
+                    weekday_name = date.strftime('%A')
+                    print(f'Date given ({date}) is a {weekday_name}. So, actual prediction is for: {pred_date} (Monday)')
+        return ys, pred_dates
+
+    def _predict_many(self, dates: List[str]):
         df = self.preprocessed_data.data_processor.raw_data_source.get_raw_df()
-        pred_date = get_prediction_date(df, self.seq_len, date)
-        x = self.preprocessed_data.get_preprocessed_prediction_dataset(pred_date)
-
-        model = self.__load_saved_model()
-        y = model.predict(x)
+        pred_dates = [get_prediction_date(df, self.seq_len, date) for date in dates]
+        x = self.preprocessed_data.get_preprocessed_prediction_batch(pred_dates)
+
+        trt_predict_fn = self.__get_trt_predict_fn()
+        if trt_predict_fn is not None:
+            # TensorRT engines are built for at most batch_size inputs
+            y = np.concatenate([trt_predict_fn(x[i: i+self.batch_size]) for i in range(0, len(x), self.batch_size)])
+        else:
+            model = self.__load_saved_model()
+            y = self.__get_predict_fn(model)(x.astype(np.float32)).numpy()
 
         actual_y = self.preprocessed_data.invTransform(y)
-        return actual_y*100, pred_date
+        return actual_y*100, pred_dates
 
-    def _get_checkpoint_path(self) -> str:
-        dirname = os.path.dirname(os.path.realpath(__file__))
-        base_path = os.path.join(dirname, SAVED_MODELS_BASE_PATH)
-        model_path = os.path.join(base_path, f'{self.name}-{self.seq_len}-{self.step}')
-        checkpoint_base_path = os.path.join(model_path, self.ticker)
+    def __get_predict_fn(self, model):
+        """Returns a traced function which predicts with model, avoiding the per call overhead of model.predict"""
+        if self._predict_fn is not None and self._predict_fn_model is model:
+            return self._predict_fn
+
+        # XLA can't compile the cuDNN LSTM kernel, so jit compile only when running on cpu
+        jit_compile = not tf.config.list_physical_devices('GPU')
 
-        checkpoint_path = os.path.join(checkpoint_base_path, 'cp.ckpt')
+        @tf.function(jit_compile=jit_compile, input_signature=[tf.TensorSpec((None, *self.input_shape), tf.float32)])
+        def predict_fn(x):
+            return model(x, training=False)
 
+        self._predict_fn = predict_fn
+        self._predict_fn_model = model
+        return predict_fn
+
+    def _get_checkpoint_path(self) -> str:
+        checkpoint_path = os.path.join(self._get_model_dir(), 'cp.ckpt')
         return checkpoint_path
 
+    def _get_trt_model_path(self) -> str:
+        return os.path.join(self._get_model_dir(), 'trt_fp16')
+
+    def _get_model_dir(self) -> str:
+        base_path = os.path.join(_BASE_DIR, SAVED_MODELS_BASE_PATH)
+        model_path = os.path.join(base_path, f'{self.name}-{self.seq_len}-{self.step}-v{self.MODEL_VERSION}')
+        model_dir = os.path.join(model_path, self.ticker)
+        return model_dir
+
     @abstractmethod
     def _create_model():
         pass
@@ -115,33 +286,44 @@ class KerasModel(Model, ABC):
 
 # you could have various LstmModels by having their own STEP, SEQ_LEN
 class LstmModel(KerasModel):
+    # v2 dropped the BatchNormalization layers between the LSTMs
+    MODEL_VERSION = 2
+    # keras only dispatches LSTM to the fused cuDNN kernel for these exact settings (and no masking)
+    CUDNN_LSTM_KWARGS = dict(activation='tanh', recurrent_activation='sigmoid', recurrent_dropout=0.0,
+                             unroll=False, use_bias=True)
 
     def _create_model(self):
+        log_gpu_availability()
+
+        # each LSTM layer below is its own cuDNN call, keras has no fused multi-layer LSTM.
+        # Don't replace them with RNN(StackedRNNCells(...)): LSTMCell never uses the cuDNN kernel.
         model = Sequential()
-        model.add(LSTM(256, input_shape=self.input_shape, return_sequences=True))
+        model.add(LSTM(256, input_shape=self.input_shape, return_sequences=True, **self.CUDNN_LSTM_KWARGS))
         model.add(Dropout(0.2))
-        model.add(BatchNormalization())
 
-        model.add(LSTM(128, return_sequences=True))
+        model.add(LSTM(128, return_sequences=True, **self.CUDNN_LSTM_KWARGS))
         model.add(Dropout(0.1))
-        model.add(BatchNormalization())
 
-        model.add(LSTM(128, return_sequences=True))
+        model.add(LSTM(128, return_sequences=True, **self.CUDNN_LSTM_KWARGS))
         model.add(Dropout(0.1))
-        model.add(BatchNormalization())
 
-        model.add(LSTM(128))
+        model.add(LSTM(128, **self.CUDNN_LSTM_KWARGS))
         model.add(Dropout(0.2))
         model.add(BatchNormalization())
 
         model.add(Dense(32, activation='relu'))
         model.add(Dropout(0.2))
 
-        model.add(Dense(1))
+        # keep the output in fp32 so that the loss is numerically stable with mixed precision
+        model.add(Dense(1, dtype='float32'))
+
+        optimizer = Adam()
+        if mixed_precision.global_policy().name == 'mixed_float16':
+            optimizer = mixed_precision.LossScaleOptimizer(optimizer)
 
         model.compile(
             loss='mse',
-            optimizer='adam',
+            optimizer=optimizer,
         )
 
         return model
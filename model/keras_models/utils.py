@@ -1,10 +1,16 @@
 import datetime as dt
+import functools
+import time
 
 import pandas as pd
 
 DATE_FORMAT = '%Y-%m-%d'
+FRIDAY = 4
+# days to add to a date (indexed by its weekday) to move Sat and Sun to the next Mon
+WEEKEND_SHIFT = (0, 0, 0, 0, 0, 2, 1)
 
 
+@functools.lru_cache(maxsize=128)
 def get_date_from_string(date: str) -> dt.date:
     try:
         return dt.datetime.strptime(date, DATE_FORMAT).date()
@@ -14,8 +20,8 @@ def get_date_from_string(date: str) -> dt.date:
 
 def get_prediction_date(df: pd.DataFrame, seq_len: int, date: str = None):
     if date is None:
-        pred_date = dt.datetime.now().date()
-        # timezone = pytz.timezone("Asia/Kolkata")
+        # same as dt.datetime.now().date() without building the datetime
+        pred_date = dt.date.fromtimestamp(time.time())
     else:
         pred_date = get_date_from_string(date)
 
@@ -31,24 +37,22 @@ def get_correct_pred_date(pred_date: dt.date, df_first_date: dt.date, df_last_da
     If df_last_date >= date - dt.timedelta(days=1) then we surely have the data for that pred_date
     """
 
-    if df_first_date + dt.timedelta(days=seq_len) > pred_date:
-        raise InvalidPredictionDateError(pred_date, df_first_date, seq_len, lower=True)
+    # dates are compared as ordinals (days since 0001-01-01) to avoid timedelta arithmetic
+    pred_ordinal = pred_date.toordinal()
+    last_ordinal = df_last_date.toordinal()
 
-    # If df_last_date is Fri and pred_date is greater than next Mon
-    if df_last_date.weekday() == 4:
-        if pred_date > df_last_date + dt.timedelta(days=3):
-            raise InvalidPredictionDateError(pred_date, df_last_date, seq_len)
+    if df_first_date.toordinal() + seq_len > pred_ordinal:
+        raise InvalidPredictionDateError(pred_date, df_first_date, seq_len, lower=True)
 
-    elif df_last_date < pred_date - dt.timedelta(days=1):
+    # If df_last_date is Fri then we can predict till next Mon, else only till the next day
+    if pred_ordinal > last_ordinal + (3 if df_last_date.weekday() == FRIDAY else 1):
         raise InvalidPredictionDateError(pred_date, df_last_date, seq_len)
 
     # If date is Sat or Sun make it Mon
-    if pred_date.weekday() == 5:
-        pred_date += dt.timedelta(days=2)
-
-    elif pred_date.weekday() == 6:
-        pred_date += dt.timedelta(days=1)
-    return pred_date
+    shift = WEEKEND_SHIFT[pred_date.weekday()]
+    if shift == 0:
+        return pred_date
+    return dt.date.fromordinal(pred_ordinal + shift)
 
 
 class InvalidPredictionDateError(Exception):
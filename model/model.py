@@ -1,6 +1,6 @@
 import datetime as dt
 from abc import ABC, abstractmethod
-from typing import Union
+from typing import List, Union
 
 from .validate import validate_ticker
 
@@ -23,3 +23,7 @@ class Model(ABC):
     @abstractmethod
     def predict(self, date: Union[dt.date, str]):
         """Method to give prediction for a date"""
+
+    @abstractmethod
+    def predict_many(self, dates: List[Union[dt.date, str]]):
+        """Method to give predictions for multiple dates at once"""
@@ -1,3 +1,5 @@
+import functools
+
 from data.constants import SYMBOL_COLUMN
 from data.utils import get_all_nse_company_names_and_ticker
 
@@ -8,9 +10,12 @@ class InvalidTickerError(Exception):
         super().__init__(msg)
 
 
-def validate_ticker(ticker):
+@functools.lru_cache(maxsize=1)
+def _get_lowercase_nse_symbols() -> frozenset:
     df = get_all_nse_company_names_and_ticker()
+    return frozenset(symbol.lower() for symbol in df[SYMBOL_COLUMN].astype(str))
 
-    df = df[df[SYMBOL_COLUMN].str.fullmatch(ticker, case=False)]
-    if len(df) <= 0:
+
+def validate_ticker(ticker):
+    if ticker.lower() not in _get_lowercase_nse_symbols():
         raise InvalidTickerError(ticker)